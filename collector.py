@@ -4,29 +4,85 @@ PingPal Collector - Monitors endpoints and records results to SQLite.
 """
 
 import asyncio
+import logging
 import sqlite3
 import time
 import yaml
 import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from typing import Dict, List, Optional
 import aiohttp
 from pathlib import Path
+from urllib.parse import urlsplit
+
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:  # PyYAML built without libyaml
+    from yaml import SafeLoader as _SafeLoader
 
 
 DB_PATH = "pingpal.db"
 CONFIG_PATH = "endpoints.yml"
 
+log = logging.getLogger("pingpal.collector")
+
+# journal_mode is persisted in the database file; the rest are per-connection
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+
+# Shared by every insert so the persistent connection reuses one cached prepared statement
+INSERT_SQL = """
+    INSERT INTO checks
+    (timestamp_utc, name, url, status_code, ok, latency_ms, error_type, error_message)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Results are flushed by writer_task() every BATCH_SIZE rows or BATCH_INTERVAL_SECONDS
+BATCH_SIZE = 100
+BATCH_INTERVAL_SECONDS = 1.0
+
+# Raw checks older than RAW_RETENTION_HOURS are folded into per-minute rows in
+# checks_1m by rollup_task(), which runs every ROLLUP_INTERVAL_SECONDS
+RAW_RETENTION_HOURS = 24
+ROLLUP_INTERVAL_SECONDS = 3600
+MINUTE_US = 60_000_000
+
+# Long-lived writer connection, opened by init_database()
+_conn: Optional[sqlite3.Connection] = None
+# Re-entrant so save_check() can run inside batch_writes()
+_write_lock = threading.RLock()
+
+
+def apply_pragmas(conn: sqlite3.Connection):
+    """Apply WAL and cache settings to a SQLite connection."""
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+
 
 def init_database():
-    """Initialize SQLite database with schema and indexes."""
+    """Initialize SQLite database with schema and indexes.
+    
+    Also opens the persistent connection used by save_check().
+    """
+    global _conn
+    
     conn = sqlite3.connect(DB_PATH)
+    apply_pragmas(conn)
     cursor = conn.cursor()
     
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS checks (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp_utc TEXT NOT NULL,
+            timestamp_utc INTEGER NOT NULL,
             name TEXT NOT NULL,
             url TEXT NOT NULL,
             status_code INTEGER,
@@ -37,20 +93,115 @@ def init_database():
         )
     """)
     
-    # Create indexes for efficient queries
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_timestamp ON checks(timestamp_utc)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_name ON checks(name)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_name_timestamp ON checks(name, timestamp_utc)")
+    # CREATE TABLE IF NOT EXISTS keeps the ISO-8601 text column of databases
+    # created by older versions, which would silently break integer cutoffs
+    cursor.execute("PRAGMA table_info(checks)")
+    column_types = {row[1]: row[2] for row in cursor.fetchall()}
+    if column_types['timestamp_utc'].upper() != 'INTEGER':
+        conn.close()
+        print(f"Error: {DB_PATH} stores timestamps as {column_types['timestamp_utc']}; "
+              f"delete it (and any -wal/-shm files) so the collector can recreate it")
+        sys.exit(1)
+    
+    # Covering indexes so the dashboard's uptime and latency aggregates are
+    # answered from index pages without touching the table
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_checks_cover
+        ON checks(name, timestamp_utc, ok, latency_ms, status_code)
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_ts_cover
+        ON checks(timestamp_utc, name, ok, latency_ms)
+    """)
+    
+    # Older databases also carry these prefixes of the covering indexes; drop
+    # them so inserts don't maintain redundant indexes
+    cursor.execute("DROP INDEX IF EXISTS idx_timestamp")
+    cursor.execute("DROP INDEX IF EXISTS idx_name")
+    cursor.execute("DROP INDEX IF EXISTS idx_name_timestamp")
+    
+    # Latest check per endpoint, kept current by a trigger so the dashboard
+    # reads one row per endpoint instead of searching the history
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS latest_status (
+            name TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            timestamp_utc INTEGER NOT NULL,
+            status_code INTEGER,
+            ok INTEGER NOT NULL,
+            latency_ms REAL NOT NULL,
+            error_type TEXT,
+            error_message TEXT
+        )
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS checks_ai AFTER INSERT ON checks
+        BEGIN
+            INSERT INTO latest_status
+            (name, url, timestamp_utc, status_code, ok, latency_ms, error_type, error_message)
+            VALUES (NEW.name, NEW.url, NEW.timestamp_utc, NEW.status_code, NEW.ok,
+                    NEW.latency_ms, NEW.error_type, NEW.error_message)
+            ON CONFLICT(name) DO UPDATE SET
+                url = excluded.url,
+                timestamp_utc = excluded.timestamp_utc,
+                status_code = excluded.status_code,
+                ok = excluded.ok,
+                latency_ms = excluded.latency_ms,
+                error_type = excluded.error_type,
+                error_message = excluded.error_message;
+        END
+    """)
+    
+    # Per-minute rollups of checks past the raw retention window
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS checks_1m (
+            name TEXT NOT NULL,
+            bucket_ts INTEGER NOT NULL,
+            n INTEGER NOT NULL,
+            ok_n INTEGER NOT NULL,
+            avg_latency REAL NOT NULL,
+            max_latency REAL NOT NULL,
+            PRIMARY KEY (name, bucket_ts)
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_1m_bucket ON checks_1m(bucket_ts)")
+    
+    # Backfill endpoints recorded before latest_status existed
+    cursor.execute("""
+        INSERT OR IGNORE INTO latest_status
+        (name, url, timestamp_utc, status_code, ok, latency_ms, error_type, error_message)
+        SELECT c.name, c.url, c.timestamp_utc, c.status_code, c.ok,
+               c.latency_ms, c.error_type, c.error_message
+        FROM checks c
+        JOIN (
+            SELECT name, MAX(id) AS max_id
+            FROM checks
+            GROUP BY name
+        ) latest ON c.id = latest.max_id
+    """)
     
     conn.commit()
     conn.close()
+    
+    close_database()
+    _conn = sqlite3.connect(DB_PATH, isolation_level=None, check_same_thread=False)
+    apply_pragmas(_conn)
+
+
+def close_database():
+    """Close the persistent connection, if open."""
+    global _conn
+    
+    if _conn is not None:
+        _conn.close()
+        _conn = None
 
 
 def load_config() -> List[Dict]:
     """Load and validate endpoint configuration from YAML."""
     try:
         with open(CONFIG_PATH, 'r') as f:
-            config = yaml.safe_load(f)
+            config = yaml.load(f, Loader=_SafeLoader)
         
         if not config or 'endpoints' not in config:
             raise ValueError("Config must contain 'endpoints' key")
@@ -63,9 +214,10 @@ def load_config() -> List[Dict]:
             endpoint = {
                 'name': ep['name'],
                 'url': ep['url'],
-                'method': ep.get('method', 'GET'),
+                'method': ep.get('method', 'HEAD'),
                 'interval_seconds': ep.get('interval_seconds', 60),
-                'timeout_seconds': ep.get('timeout_seconds', 5)
+                'timeout_seconds': ep.get('timeout_seconds', 5),
+                'follow_redirects': ep.get('follow_redirects', True)
             }
             endpoints.append(endpoint)
         
@@ -78,34 +230,112 @@ def load_config() -> List[Dict]:
         sys.exit(1)
 
 
-def save_check(result: Dict):
-    """Save check result to database."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO checks 
-        (timestamp_utc, name, url, status_code, ok, latency_ms, error_type, error_message)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+def _check_row(result: Dict) -> tuple:
+    """Build the INSERT_SQL parameters for a check result."""
+    return (
         result['timestamp_utc'],
         result['name'],
         result['url'],
         result['status_code'],
-        result['ok'],
+        int(result['ok']),
         result['latency_ms'],
         result['error_type'],
         result['error_message']
-    ))
+    )
+
+
+def save_check(result: Dict):
+    """Save check result to database."""
+    with _write_lock:
+        _conn.execute(INSERT_SQL, _check_row(result))
+
+
+@contextmanager
+def batch_writes():
+    """Group writes on the persistent connection into a single transaction.
     
-    conn.commit()
-    conn.close()
+    Commits when the block exits and rolls back if it raises.
+    """
+    with _write_lock, _conn:
+        _conn.execute("BEGIN")
+        yield _conn
+
+
+def save_checks(results: List[Dict]):
+    """Save a batch of check results in a single transaction."""
+    rows = [_check_row(result) for result in results]
+    
+    with batch_writes() as conn:
+        conn.executemany(INSERT_SQL, rows)
+
+
+async def writer_task(result_q: asyncio.Queue):
+    """Drain result_q and write results to the database in batches."""
+    batch = []
+    
+    try:
+        while True:
+            batch.append(await result_q.get())
+            
+            # Let other checks land in the same transaction unless a full batch is waiting
+            if len(batch) + result_q.qsize() < BATCH_SIZE:
+                await asyncio.sleep(BATCH_INTERVAL_SECONDS)
+            
+            while len(batch) < BATCH_SIZE and not result_q.empty():
+                batch.append(result_q.get_nowait())
+            
+            save_checks(batch)
+            batch = []
+    finally:
+        # Flush whatever is still pending on shutdown
+        while not result_q.empty():
+            batch.append(result_q.get_nowait())
+        if batch:
+            save_checks(batch)
+
+
+def rollup_checks(cutoff_us: int):
+    """Fold raw checks older than cutoff_us into checks_1m and delete them.
+    
+    cutoff_us should fall on a minute boundary so no bucket is split
+    between two rollups.
+    """
+    with batch_writes() as conn:
+        conn.execute("""
+            INSERT INTO checks_1m (name, bucket_ts, n, ok_n, avg_latency, max_latency)
+            SELECT
+                name,
+                (timestamp_utc / ?) * ? AS bucket,
+                COUNT(*),
+                SUM(ok),
+                AVG(latency_ms),
+                MAX(latency_ms)
+            FROM checks
+            WHERE timestamp_utc < ?
+            GROUP BY name, bucket
+            ON CONFLICT(name, bucket_ts) DO UPDATE SET
+                n = n + excluded.n,
+                ok_n = ok_n + excluded.ok_n,
+                avg_latency = (avg_latency * n + excluded.avg_latency * excluded.n) / (n + excluded.n),
+                max_latency = MAX(max_latency, excluded.max_latency)
+        """, (MINUTE_US, MINUTE_US, cutoff_us))
+        conn.execute("DELETE FROM checks WHERE timestamp_utc < ?", (cutoff_us,))
+
+
+async def rollup_task():
+    """Periodically roll up raw checks past the retention window."""
+    retention_us = RAW_RETENTION_HOURS * 3600 * 1_000_000
+    
+    while True:
+        cutoff_us = (time.time_ns() // 1000 - retention_us) // MINUTE_US * MINUTE_US
+        rollup_checks(cutoff_us)
+        await asyncio.sleep(ROLLUP_INTERVAL_SECONDS)
 
 
 async def check_endpoint(session: aiohttp.ClientSession, endpoint: Dict) -> Dict:
     """Perform a single endpoint check."""
     start_time = time.time()
-    timestamp_utc = datetime.now(timezone.utc).isoformat()
+    timestamp_utc = time.time_ns() // 1000  # epoch microseconds
     
     result = {
         'timestamp_utc': timestamp_utc,
@@ -119,18 +349,31 @@ async def check_endpoint(session: aiohttp.ClientSession, endpoint: Dict) -> Dict
     }
     
     try:
-        timeout = aiohttp.ClientTimeout(total=endpoint['timeout_seconds'])
+        # connect bounds the pool wait, DNS lookup and connection setup;
+        # sock_read bounds each wait for response data
+        timeout = aiohttp.ClientTimeout(
+            connect=endpoint['timeout_seconds'],
+            sock_read=endpoint['timeout_seconds']
+        )
         method = endpoint['method'].upper()
         
-        async with session.request(method, endpoint['url'], timeout=timeout) as response:
+        # Only the status is needed, so the body is never read. Unless the
+        # endpoint opts out, redirects are followed and the final status judged.
+        async with session.request(
+            method,
+            endpoint['url'],
+            timeout=timeout,
+            allow_redirects=endpoint['follow_redirects']
+        ) as response:
             result['status_code'] = response.status
             result['ok'] = 200 <= response.status < 400
             result['latency_ms'] = (time.time() - start_time) * 1000
             
     except asyncio.TimeoutError:
+        elapsed = time.time() - start_time
         result['error_type'] = 'Timeout'
-        result['error_message'] = f"Request timed out after {endpoint['timeout_seconds']}s"
-        result['latency_ms'] = endpoint['timeout_seconds'] * 1000
+        result['error_message'] = f"Request timed out after {elapsed:.1f}s"
+        result['latency_ms'] = elapsed * 1000
     except aiohttp.ClientError as e:
         result['error_type'] = 'ClientError'
         result['error_message'] = str(e)
@@ -143,19 +386,47 @@ async def check_endpoint(session: aiohttp.ClientSession, endpoint: Dict) -> Dict
     return result
 
 
-async def monitor_endpoint(session: aiohttp.ClientSession, endpoint: Dict):
+async def monitor_endpoint(session: aiohttp.ClientSession, endpoint: Dict, result_q: asyncio.Queue):
     """Monitor a single endpoint at its specified interval."""
     interval = endpoint['interval_seconds']
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
     
     while True:
-        result = await check_endpoint(session, endpoint)
-        save_check(result)
+        # Sleep until the next scheduled tick so check latency doesn't add drift
+        sleep_for = next_tick - loop.time()
+        if sleep_for > 0:
+            await asyncio.sleep(sleep_for)
         
-        # Compact console log
-        status = f"✓ {result['status_code']}" if result['ok'] else f"✗ {result['error_type'] or result['status_code']}"
-        print(f"{result['timestamp_utc'][:19]} | {result['name']:20} | {status:15} | {result['latency_ms']:6.1f}ms")
+        # A check that overran its interval starts the next one immediately
+        # rather than firing a burst of catch-up checks
+        next_tick = max(next_tick + interval, loop.time())
         
-        await asyncio.sleep(interval)
+        result = await check_endpoint(session, endpoint)
+        await result_q.put(result)
+        
+        # Compact console log, skipped entirely when INFO is disabled
+        if log.isEnabledFor(logging.INFO):
+            status = f"✓ {result['status_code']}" if result['ok'] else f"✗ {result['error_type'] or result['status_code']}"
+            timestamp = datetime.fromtimestamp(result['timestamp_utc'] / 1e6, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S")
+            log.info("%s | %-20s | %-15s | %6.1fms", timestamp, result['name'], status, result['latency_ms'])
+
+
+class _BufferedStreamHandler(logging.StreamHandler):
+    """StreamHandler that leaves flushing to the stream's own buffering, like print()."""
+    
+    def flush(self):
+        pass
+
+
+def setup_logging():
+    """Send collector log records to stdout as bare messages."""
+    handler = _BufferedStreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+    # Don't repeat every check line through a configured root logger
+    log.propagate = False
 
 
 async def main():
@@ -171,14 +442,36 @@ async def main():
     print(f"PingPal Collector started - monitoring {len(endpoints)} endpoint(s)")
     print("Press Ctrl+C to stop\n")
     
-    async with aiohttp.ClientSession() as session:
-        tasks = [monitor_endpoint(session, ep) for ep in endpoints]
+    # Each monitor has at most one request in flight, so a host never needs
+    # more connections than it has endpoints. Sizing the caps that way means
+    # checks never queue for a pool slot, which would otherwise count towards
+    # their latency and connect timeout. Connections are kept alive between
+    # checks and DNS lookups are cached.
+    endpoints_per_host = Counter(urlsplit(ep['url']).hostname for ep in endpoints)
+    connector = aiohttp.TCPConnector(
+        limit=len(endpoints) * 2,
+        limit_per_host=max(endpoints_per_host.values()),
+        ttl_dns_cache=300,
+        keepalive_timeout=75,
+        enable_cleanup_closed=True
+    )
+    session_timeout = aiohttp.ClientTimeout(total=None)
+    
+    async with aiohttp.ClientSession(connector=connector, timeout=session_timeout) as session:
+        # Created here so the queue belongs to the loop started by asyncio.run()
+        result_q: asyncio.Queue = asyncio.Queue()
+        tasks = [monitor_endpoint(session, ep, result_q) for ep in endpoints]
+        tasks.append(writer_task(result_q))
+        tasks.append(rollup_task())
         try:
             await asyncio.gather(*tasks)
         except KeyboardInterrupt:
             print("\n\nShutting down...")
+        finally:
+            close_database()
 
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(main())
 
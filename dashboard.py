@@ -4,26 +4,101 @@ PingPal Dashboard - Streamlit dashboard for monitoring endpoint status.
 """
 
 import sqlite3
+import time
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from datetime import datetime, timedelta, timezone
+from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 
 DB_PATH = "pingpal.db"
 
+# How long query results are reused across Streamlit reruns
+CACHE_TTL_SECONDS = 30
+
+# Upper bound on points per endpoint in the latency chart
+MAX_CHART_POINTS = 2000
+
+# Windows at least this long read the collector's per-minute rollups
+ROLLUP_WINDOW_HOURS = 24
+
+# Must match the collector's rollup bucket width (collector.MINUTE_US)
+MINUTE_US = 60_000_000
+
+# Column order of the rows returned by get_latest_status()
+LATEST_STATUS_COLUMNS = [
+    'name', 'url', 'timestamp_utc', 'status_code', 'ok', 'latency_ms', 'error_type', 'error_message'
+]
+
+# Per-connection settings; the collector switches the database to WAL so
+# dashboard reads never block its writes
+SQLITE_PRAGMAS = (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-20000",
+    "PRAGMA busy_timeout=5000",
+)
+
 
 def get_db_connection():
     """Get database connection."""
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def minute_rows_cte(name: Optional[str]) -> str:
+    """Build a minute_rows CTE combining checks_1m with raw checks bucketed the same way.
+    
+    Raw rows newer than the last rollup are still in checks, so both tables
+    are needed to cover a window. Expects :cutoff (and :name if given) params.
+    """
+    if name:
+        checks_source = "checks"
+        name_filter = "AND name = :name"
+    else:
+        # Pinned for the same reason as in get_uptime_for_window()
+        checks_source = "checks INDEXED BY idx_ts_cover"
+        name_filter = ""
+    
+    return f"""
+        WITH minute_rows AS (
+            SELECT name, bucket_ts, n, ok_n, avg_latency, max_latency
+            FROM checks_1m
+            WHERE bucket_ts >= :cutoff {name_filter}
+            UNION ALL
+            SELECT
+                name,
+                (timestamp_utc / {MINUTE_US}) * {MINUTE_US} AS bucket_ts,
+                COUNT(*) AS n,
+                SUM(ok) AS ok_n,
+                AVG(latency_ms) AS avg_latency,
+                MAX(latency_ms) AS max_latency
+            FROM {checks_source}
+            WHERE timestamp_utc >= :cutoff {name_filter}
+            GROUP BY name, (timestamp_utc / {MINUTE_US})
+        )
+    """
 
 
-def get_latest_status():
-    """Get latest check result for each endpoint."""
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def get_endpoint_names() -> List[str]:
+    """Get the names of all endpoints with recorded checks."""
+    conn = get_db_connection()
+    names = [row[0] for row in conn.execute("SELECT name FROM latest_status ORDER BY name")]
+    conn.close()
+    return names
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def get_latest_status() -> List[tuple]:
+    """Get latest check result for each endpoint as LATEST_STATUS_COLUMNS rows."""
     conn = get_db_connection()
     
+    # latest_status is maintained by the collector's insert trigger
     query = """
         SELECT 
             name,
@@ -34,27 +109,38 @@ def get_latest_status():
             latency_ms,
             error_type,
             error_message
-        FROM checks
-        WHERE (name, timestamp_utc) IN (
-            SELECT name, MAX(timestamp_utc)
-            FROM checks
-            GROUP BY name
-        )
+        FROM latest_status
         ORDER BY name
     """
     
-    df = pd.read_sql_query(query, conn)
+    rows = conn.execute(query).fetchall()
     conn.close()
-    return df
+    return rows
 
 
 def get_checks_for_window(name: Optional[str], hours: int):
-    """Get checks within the specified time window."""
+    """Get checks within the specified time window.
+    
+    Windows of ROLLUP_WINDOW_HOURS or more return one row per endpoint and minute.
+    """
     conn = get_db_connection()
     
-    cutoff = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+    cutoff = int((time.time() - hours * 3600) * 1_000_000)
     
-    if name:
+    if hours >= ROLLUP_WINDOW_HOURS:
+        query = minute_rows_cte(name) + """
+            SELECT 
+                bucket_ts AS timestamp_utc,
+                name,
+                n AS checks,
+                ok_n AS ok_checks,
+                avg_latency AS latency_ms,
+                max_latency AS max_latency_ms
+            FROM minute_rows
+            ORDER BY timestamp_utc
+        """
+        df = pd.read_sql_query(query, conn, params={'name': name, 'cutoff': cutoff})
+    elif name:
         query = """
             SELECT 
                 timestamp_utc,
@@ -91,15 +177,109 @@ def get_checks_for_window(name: Optional[str], hours: int):
     return df
 
 
-def calculate_uptime(df: pd.DataFrame) -> float:
-    """Calculate uptime percentage from dataframe."""
-    if df.empty:
-        return 0.0
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def get_uptime_for_window(name: Optional[str], hours: int):
+    """Get uptime percentage and check count per endpoint within the time window."""
+    conn = get_db_connection()
     
-    total_checks = len(df)
-    successful_checks = len(df[df['ok'] == 1])
+    cutoff = int((time.time() - hours * 3600) * 1_000_000)
     
-    return (successful_checks / total_checks * 100) if total_checks > 0 else 0.0
+    if hours >= ROLLUP_WINDOW_HOURS:
+        query = minute_rows_cte(name) + """
+            SELECT 
+                name,
+                SUM(ok_n) * 100.0 / SUM(n) AS uptime,
+                SUM(n) AS checks
+            FROM minute_rows
+            GROUP BY name
+            ORDER BY name
+        """
+        df = pd.read_sql_query(query, conn, params={'name': name, 'cutoff': cutoff})
+    elif name:
+        query = """
+            SELECT 
+                name,
+                AVG(ok) * 100 AS uptime,
+                COUNT(*) AS checks
+            FROM checks
+            WHERE name = ? AND timestamp_utc >= ?
+            GROUP BY name
+        """
+        df = pd.read_sql_query(query, conn, params=(name, cutoff))
+    else:
+        # Pin the time-ordered index; otherwise the planner walks all of
+        # idx_checks_cover to satisfy GROUP BY name
+        query = """
+            SELECT 
+                name,
+                AVG(ok) * 100 AS uptime,
+                COUNT(*) AS checks
+            FROM checks INDEXED BY idx_ts_cover
+            WHERE timestamp_utc >= ?
+            GROUP BY name
+            ORDER BY name
+        """
+        df = pd.read_sql_query(query, conn, params=(cutoff,))
+    
+    conn.close()
+    return df
+
+
+@st.cache_data(ttl=CACHE_TTL_SECONDS)
+def get_latency_series(name: Optional[str], hours: int):
+    """Get average latency per time bucket, sized to at most MAX_CHART_POINTS per endpoint."""
+    conn = get_db_connection()
+    
+    cutoff = int((time.time() - hours * 3600) * 1_000_000)
+    bucket_us = max(1, hours * 3600 * 1_000_000 // MAX_CHART_POINTS)
+    
+    if hours >= ROLLUP_WINDOW_HOURS:
+        query = minute_rows_cte(name) + """
+            SELECT 
+                name,
+                (bucket_ts / :bucket_us) * :bucket_us AS bucket_utc,
+                SUM(avg_latency * n) / SUM(n) AS latency_ms
+            FROM minute_rows
+            GROUP BY name, bucket_utc
+            ORDER BY name, bucket_utc
+        """
+        params = {'name': name, 'cutoff': cutoff, 'bucket_us': bucket_us}
+    elif name:
+        query = """
+            SELECT 
+                name,
+                (timestamp_utc / :bucket_us) * :bucket_us AS bucket_utc,
+                AVG(latency_ms) AS latency_ms
+            FROM checks
+            WHERE name = :name AND timestamp_utc >= :cutoff
+            GROUP BY name, bucket_utc
+            ORDER BY bucket_utc
+        """
+        params = {'name': name, 'cutoff': cutoff, 'bucket_us': bucket_us}
+    else:
+        # Pinned for the same reason as in get_uptime_for_window()
+        query = """
+            SELECT 
+                name,
+                (timestamp_utc / :bucket_us) * :bucket_us AS bucket_utc,
+                AVG(latency_ms) AS latency_ms
+            FROM checks INDEXED BY idx_ts_cover
+            WHERE timestamp_utc >= :cutoff
+            GROUP BY name, bucket_utc
+            ORDER BY name, bucket_utc
+        """
+        params = {'cutoff': cutoff, 'bucket_us': bucket_us}
+    
+    df = pd.read_sql_query(query, conn, params=params)
+    conn.close()
+    return df
+
+
+def get_export_csv(name: Optional[str], hours: int) -> bytes:
+    """Get checks within the time window serialized as CSV."""
+    df = get_checks_for_window(name, hours)
+    df['timestamp'] = pd.to_datetime(df['timestamp_utc'], unit='us', utc=True)
+    return df.to_csv(index=False).encode()
 
 
 def main():
@@ -115,11 +295,7 @@ def main():
     st.sidebar.header("Filters")
     
     # Get unique endpoint names
-    conn = get_db_connection()
-    names_df = pd.read_sql_query("SELECT DISTINCT name FROM checks ORDER BY name", conn)
-    conn.close()
-    
-    endpoint_names = ["All"] + names_df['name'].tolist()
+    endpoint_names = ["All"] + get_endpoint_names()
     selected_endpoint = st.sidebar.selectbox("Endpoint", endpoint_names)
     
     time_windows = {
@@ -133,16 +309,17 @@ def main():
     
     # Current Status Table
     st.header("Current Status")
-    latest_df = get_latest_status()
+    latest_rows = get_latest_status()
     
-    if not latest_df.empty:
+    if latest_rows:
         # Format the status table
-        status_df = latest_df[['name', 'url', 'timestamp_utc', 'status_code', 'ok', 'latency_ms']].copy()
+        status_df = pd.DataFrame(latest_rows, columns=LATEST_STATUS_COLUMNS)
         status_df['status'] = status_df.apply(
             lambda row: f"✓ {int(row['status_code'])}" if row['ok'] else "✗ Error",
             axis=1
         )
         status_df['latency_ms'] = status_df['latency_ms'].round(1)
+        status_df['timestamp_utc'] = pd.to_datetime(status_df['timestamp_utc'], unit='us', utc=True)
         status_df = status_df[['name', 'url', 'status', 'latency_ms', 'timestamp_utc']]
         status_df.columns = ['Name', 'URL', 'Status', 'Latency (ms)', 'Last Check']
         
@@ -155,43 +332,37 @@ def main():
     
     # Get data for selected window
     endpoint_filter = None if selected_endpoint == "All" else selected_endpoint
-    history_df = get_checks_for_window(endpoint_filter, window_hours)
+    uptime_df = get_uptime_for_window(endpoint_filter, window_hours)
     
-    if history_df.empty:
+    if uptime_df.empty:
         st.info(f"No data available for the selected time window ({selected_window}).")
     else:
-        # Convert timestamp to datetime
-        history_df['timestamp'] = pd.to_datetime(history_df['timestamp_utc'])
-        
         # Uptime Percentage
         col1, col2 = st.columns(2)
         
         with col1:
             if endpoint_filter:
-                uptime = calculate_uptime(history_df)
+                uptime = uptime_df['uptime'].iloc[0]
                 st.metric("Uptime", f"{uptime:.2f}%")
             else:
                 st.write("**Uptime by Endpoint:**")
-                uptime_data = []
-                for name in history_df['name'].unique():
-                    endpoint_df = history_df[history_df['name'] == name]
-                    uptime_pct = calculate_uptime(endpoint_df)
-                    uptime_data.append({'Endpoint': name, 'Uptime %': uptime_pct})
-                
-                uptime_df = pd.DataFrame(uptime_data)
-                st.dataframe(uptime_df, use_container_width=True, hide_index=True)
+                endpoint_uptime_df = uptime_df[['name', 'uptime']].copy()
+                endpoint_uptime_df.columns = ['Endpoint', 'Uptime %']
+                st.dataframe(endpoint_uptime_df, use_container_width=True, hide_index=True)
         
         with col2:
-            total_checks = len(history_df)
+            total_checks = int(uptime_df['checks'].sum())
             st.metric("Total Checks", total_checks)
         
         # Latency Chart
         st.subheader("Latency Over Time")
+        chart_df = get_latency_series(endpoint_filter, window_hours)
+        chart_df['timestamp'] = pd.to_datetime(chart_df['bucket_utc'], unit='us', utc=True)
         
         if endpoint_filter:
             # Single endpoint - line chart
             fig = px.line(
-                history_df,
+                chart_df,
                 x='timestamp',
                 y='latency_ms',
                 title=f"Latency for {endpoint_filter}",
@@ -201,7 +372,7 @@ def main():
         else:
             # Multiple endpoints - line chart with different colors
             fig = px.line(
-                history_df,
+                chart_df,
                 x='timestamp',
                 y='latency_ms',
                 color='name',
@@ -212,15 +383,30 @@ def main():
         
         st.plotly_chart(fig, use_container_width=True)
         
-        # Export CSV
+        # Export CSV - raw rows are only read once the user asks for them
         st.subheader("Export Data")
-        csv = history_df.to_csv(index=False)
-        st.download_button(
-            label="Download CSV",
-            data=csv,
-            file_name=f"pingpal_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv"
-        )
+        export_key = (endpoint_filter, window_hours)
+        
+        if st.button("Prepare CSV"):
+            st.session_state['export'] = {
+                'key': export_key,
+                'csv': get_export_csv(endpoint_filter, window_hours),
+                'file_name': f"pingpal_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+            }
+        
+        export = st.session_state.get('export')
+        if export and export['key'] != export_key:
+            # Filters changed since the export was prepared
+            del st.session_state['export']
+            export = None
+        
+        if export:
+            st.download_button(
+                label="Download CSV",
+                data=export['csv'],
+                file_name=export['file_name'],
+                mime="text/csv"
+            )
 
 
 if __name__ == "__main__":
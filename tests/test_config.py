@@ -22,7 +22,8 @@ def test_load_valid_config():
                 'url': 'https://example.com',
                 'method': 'GET',
                 'interval_seconds': 30,
-                'timeout_seconds': 5
+                'timeout_seconds': 5,
+                'follow_redirects': False
             }
         ]
     }
@@ -45,6 +46,7 @@ def test_load_valid_config():
         assert endpoints[0]['method'] == 'GET'
         assert endpoints[0]['interval_seconds'] == 30
         assert endpoints[0]['timeout_seconds'] == 5
+        assert endpoints[0]['follow_redirects'] is False
         
         collector.CONFIG_PATH = original_path
     finally:
@@ -73,9 +75,10 @@ def test_load_config_with_defaults():
         
         endpoints = load_config()
         
-        assert endpoints[0]['method'] == 'GET'
+        assert endpoints[0]['method'] == 'HEAD'
         assert endpoints[0]['interval_seconds'] == 60
         assert endpoints[0]['timeout_seconds'] == 5
+        assert endpoints[0]['follow_redirects'] is True
         
         collector.CONFIG_PATH = original_path
     finally:
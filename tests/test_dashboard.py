@@ -0,0 +1,149 @@
+"""Tests for dashboard window queries over raw checks and minute rollups."""
+
+import pytest
+import math
+import sqlite3
+import tempfile
+import os
+from pathlib import Path
+import sys
+import time
+
+# Add parent directory to path to import collector and dashboard
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import dashboard
+from collector import init_database, save_checks, MINUTE_US
+
+
+# get_latency_series() bucket size for the 7 day window
+WEEK_BUCKET_US = 168 * 3600 * 1_000_000 // dashboard.MAX_CHART_POINTS
+
+
+def make_result(name, timestamp_utc, ok, latency_ms):
+    return {
+        'timestamp_utc': timestamp_utc,
+        'name': name,
+        'url': f'https://example.com/{name}',
+        'status_code': 200 if ok else 500,
+        'ok': ok,
+        'latency_ms': latency_ms,
+        'error_type': None,
+        'error_message': None
+    }
+
+
+@pytest.fixture
+def seeded_db():
+    """Create a database with rollups from two days ago and recent raw checks."""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    
+    import collector
+    original_collector_path = collector.DB_PATH
+    original_dashboard_path = dashboard.DB_PATH
+    collector.DB_PATH = db_path
+    dashboard.DB_PATH = db_path
+    
+    init_database()
+    
+    now_us = time.time_ns() // 1000
+    
+    # Old rollups start on a boundary shared by minutes and 7 day chart buckets
+    shared_step = WEEK_BUCKET_US * MINUTE_US // math.gcd(WEEK_BUCKET_US, MINUTE_US)
+    old_bucket = (now_us - 48 * 3600 * 1_000_000) // shared_step * shared_step
+    
+    conn = sqlite3.connect(db_path)
+    conn.executemany("""
+        INSERT INTO checks_1m (name, bucket_ts, n, ok_n, avg_latency, max_latency)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        ('A', old_bucket, 4, 2, 100.0, 200.0),
+        ('A', old_bucket + MINUTE_US, 1, 1, 600.0, 600.0),
+        ('B', old_bucket, 2, 2, 50.0, 60.0),
+    ])
+    conn.commit()
+    conn.close()
+    
+    recent_minute = (now_us - 10 * MINUTE_US) // MINUTE_US * MINUTE_US
+    save_checks([
+        make_result('A', recent_minute, True, 300.0),
+        make_result('A', recent_minute, True, 500.0),
+        make_result('B', recent_minute, True, 80.0),
+    ])
+    
+    for query in (dashboard.get_uptime_for_window, dashboard.get_latency_series):
+        query.clear()
+    
+    yield {'old_bucket': old_bucket, 'recent_minute': recent_minute}
+    
+    # Cleanup
+    collector.close_database()
+    collector.DB_PATH = original_collector_path
+    dashboard.DB_PATH = original_dashboard_path
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def test_uptime_combines_rollups_and_raw_checks(seeded_db):
+    """Test that long windows count rollup rows and recent raw checks together."""
+    df = dashboard.get_uptime_for_window(None, 168)
+    rows = {row['name']: row for row in df.to_dict('records')}
+    
+    assert rows['A']['checks'] == 7
+    assert rows['A']['uptime'] == pytest.approx(5 / 7 * 100)
+    assert rows['B']['checks'] == 3
+    assert rows['B']['uptime'] == pytest.approx(100.0)
+
+
+def test_uptime_for_single_endpoint_across_rollups(seeded_db):
+    """Test the name-filtered long window query."""
+    df = dashboard.get_uptime_for_window('A', 168)
+    
+    assert df['name'].tolist() == ['A']
+    assert df['checks'].iloc[0] == 7
+    assert df['uptime'].iloc[0] == pytest.approx(5 / 7 * 100)
+
+
+def test_uptime_excludes_rollups_outside_window(seeded_db):
+    """Test that a 24 hour window only sees the recent raw checks."""
+    df = dashboard.get_uptime_for_window('A', 24)
+    
+    assert df['checks'].iloc[0] == 2
+    assert df['uptime'].iloc[0] == pytest.approx(100.0)
+
+
+def test_uptime_for_short_window_reads_raw_checks(seeded_db):
+    """Test that windows under ROLLUP_WINDOW_HOURS aggregate raw checks."""
+    df = dashboard.get_uptime_for_window(None, 1)
+    
+    assert df[['name', 'checks']].values.tolist() == [['A', 2], ['B', 1]]
+
+
+def test_latency_series_weights_rollups_by_count(seeded_db):
+    """Test that chart buckets average minute rows weighted by their check count."""
+    for name in (None, 'A'):
+        dashboard.get_latency_series.clear()
+        df = dashboard.get_latency_series(name, 168)
+        series = df[df['name'] == 'A']
+        
+        old_bucket = seeded_db['old_bucket']
+        recent_bucket = seeded_db['recent_minute'] // WEEK_BUCKET_US * WEEK_BUCKET_US
+        
+        assert series['bucket_utc'].tolist() == [old_bucket, recent_bucket]
+        assert series['latency_ms'].tolist() == pytest.approx([(100.0 * 4 + 600.0) / 5, 400.0])
+
+
+def test_checks_for_long_window_returns_minute_rows(seeded_db):
+    """Test that long windows export one row per endpoint and minute."""
+    df = dashboard.get_checks_for_window('A', 168)
+    
+    old_bucket = seeded_db['old_bucket']
+    recent_minute = seeded_db['recent_minute']
+    
+    assert df['timestamp_utc'].tolist() == [old_bucket, old_bucket + MINUTE_US, recent_minute]
+    assert df['checks'].tolist() == [4, 1, 2]
+    assert df['ok_checks'].tolist() == [2, 1, 2]
+    assert df['latency_ms'].tolist() == pytest.approx([100.0, 600.0, 400.0])
+    assert df['max_latency_ms'].tolist() == pytest.approx([200.0, 600.0, 500.0])
@@ -1,17 +1,18 @@
 """Tests for database operations."""
 
 import pytest
+import asyncio
 import sqlite3
 import tempfile
 import os
 from pathlib import Path
 import sys
-from datetime import datetime, timezone
+import time
 
 # Add parent directory to path to import collector
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from collector import init_database, save_check
+from collector import init_database, save_check, save_checks, rollup_checks, batch_writes, writer_task
 
 
 @pytest.fixture
@@ -30,9 +31,11 @@ def temp_db():
     yield db_path
     
     # Cleanup
+    collector.close_database()
     collector.DB_PATH = original_path
-    if os.path.exists(db_path):
-        os.unlink(db_path)
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.unlink(path)
 
 
 def test_init_database(temp_db):
@@ -53,6 +56,7 @@ def test_init_database(temp_db):
     
     assert 'id' in columns
     assert 'timestamp_utc' in columns
+    assert columns['timestamp_utc'] == 'INTEGER'
     assert 'name' in columns
     assert 'url' in columns
     assert 'status_code' in columns
@@ -68,17 +72,88 @@ def test_init_database(temp_db):
     """)
     indexes = [row[0] for row in cursor.fetchall()]
     
-    assert 'idx_timestamp' in indexes
-    assert 'idx_name' in indexes
-    assert 'idx_name_timestamp' in indexes
+    assert 'idx_checks_cover' in indexes
+    assert 'idx_ts_cover' in indexes
     
+    # Superseded by the covering indexes
+    assert 'idx_timestamp' not in indexes
+    assert 'idx_name' not in indexes
+    assert 'idx_name_timestamp' not in indexes
+    
+    # Check latest_status table and its trigger exist
+    cursor.execute("""
+        SELECT name FROM sqlite_master 
+        WHERE type='table' AND name='latest_status'
+    """)
+    assert cursor.fetchone() is not None
+    
+    cursor.execute("""
+        SELECT name FROM sqlite_master 
+        WHERE type='trigger' AND name='checks_ai'
+    """)
+    assert cursor.fetchone() is not None
+    
+    # Check rollup table exists
+    cursor.execute("""
+        SELECT name FROM sqlite_master 
+        WHERE type='table' AND name='checks_1m'
+    """)
+    assert cursor.fetchone() is not None
+    
+    conn.close()
+
+
+def test_init_database_enables_wal(temp_db):
+    """Test database initialization switches the journal to WAL."""
+    conn = sqlite3.connect(temp_db)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA journal_mode")
+    journal_mode = cursor.fetchone()[0]
+    conn.close()
+    
+    assert journal_mode == 'wal'
+
+
+def test_init_database_rejects_text_timestamps():
+    """Test that a database with the old text timestamp column is refused."""
+    db_fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(db_fd)
+    
+    conn = sqlite3.connect(db_path)
+    conn.execute("""
+        CREATE TABLE checks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp_utc TEXT NOT NULL,
+            name TEXT NOT NULL,
+            url TEXT NOT NULL,
+            status_code INTEGER,
+            ok INTEGER NOT NULL,
+            latency_ms REAL NOT NULL,
+            error_type TEXT,
+            error_message TEXT
+        )
+    """)
+    conn.commit()
     conn.close()
+    
+    import collector
+    original_path = collector.DB_PATH
+    collector.DB_PATH = db_path
+    
+    try:
+        with pytest.raises(SystemExit):
+            init_database()
+    finally:
+        collector.DB_PATH = original_path
+        for path in (db_path, db_path + '-wal', db_path + '-shm'):
+            if os.path.exists(path):
+                os.unlink(path)
 
 
 def test_save_check_success(temp_db):
     """Test saving a successful check."""
     result = {
-        'timestamp_utc': datetime.now(timezone.utc).isoformat(),
+        'timestamp_utc': int(time.time() * 1_000_000),
         'name': 'Test Endpoint',
         'url': 'https://example.com',
         'status_code': 200,
@@ -107,7 +182,7 @@ def test_save_check_success(temp_db):
 def test_save_check_failure(temp_db):
     """Test saving a failed check."""
     result = {
-        'timestamp_utc': datetime.now(timezone.utc).isoformat(),
+        'timestamp_utc': int(time.time() * 1_000_000),
         'name': 'Failed Endpoint',
         'url': 'https://example.com',
         'status_code': None,
@@ -132,12 +207,88 @@ def test_save_check_failure(temp_db):
     assert row[8] == 'Request timed out'
 
 
+def test_save_checks_batch(temp_db):
+    """Test saving a batch of checks in one transaction."""
+    results = [
+        {
+            'timestamp_utc': int(time.time() * 1_000_000),
+            'name': f'Endpoint {i}',
+            'url': f'https://example.com/{i}',
+            'status_code': 200,
+            'ok': True,
+            'latency_ms': float(i),
+            'error_type': None,
+            'error_message': None
+        }
+        for i in range(5)
+    ]
+    
+    save_checks(results)
+    
+    conn = sqlite3.connect(temp_db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name, latency_ms FROM checks ORDER BY id")
+    rows = cursor.fetchall()
+    conn.close()
+    
+    assert rows == [(f'Endpoint {i}', float(i)) for i in range(5)]
+
+
+def test_writer_task_flushes_on_cancel(temp_db):
+    """Test that the writer batches queued results and flushes the rest on cancel."""
+    def make_result(i):
+        return {
+            'timestamp_utc': int(time.time() * 1_000_000),
+            'name': f'Endpoint {i}',
+            'url': f'https://example.com/{i}',
+            'status_code': 200,
+            'ok': True,
+            'latency_ms': float(i),
+            'error_type': None,
+            'error_message': None
+        }
+    
+    def count_rows():
+        conn = sqlite3.connect(temp_db)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM checks")
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+    
+    async def run():
+        import collector
+        result_q = asyncio.Queue()
+        
+        # A full batch is written without waiting for the batch interval
+        for i in range(collector.BATCH_SIZE):
+            result_q.put_nowait(make_result(i))
+        task = asyncio.create_task(writer_task(result_q))
+        await asyncio.sleep(0.1)
+        batched = count_rows()
+        
+        # Results still queued at shutdown are flushed
+        for i in range(3):
+            result_q.put_nowait(make_result(i))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return batched, result_q.qsize()
+    
+    batched, pending = asyncio.run(run())
+    
+    assert batched == 100
+    assert pending == 0
+    assert count_rows() == 103
+
+
 def test_get_latest_status(temp_db):
     """Test querying latest status for each endpoint."""
     # Insert multiple checks for same endpoint
     results = [
         {
-            'timestamp_utc': '2024-01-01T10:00:00+00:00',
+            'timestamp_utc': 1704103200000000,
             'name': 'Endpoint A',
             'url': 'https://example.com/a',
             'status_code': 200,
@@ -147,7 +298,7 @@ def test_get_latest_status(temp_db):
             'error_message': None
         },
         {
-            'timestamp_utc': '2024-01-01T11:00:00+00:00',
+            'timestamp_utc': 1704106800000000,
             'name': 'Endpoint A',
             'url': 'https://example.com/a',
             'status_code': 200,
@@ -157,7 +308,7 @@ def test_get_latest_status(temp_db):
             'error_message': None
         },
         {
-            'timestamp_utc': '2024-01-01T10:30:00+00:00',
+            'timestamp_utc': 1704105000000000,
             'name': 'Endpoint B',
             'url': 'https://example.com/b',
             'status_code': 404,
@@ -168,8 +319,9 @@ def test_get_latest_status(temp_db):
         }
     ]
     
-    for result in results:
-        save_check(result)
+    with batch_writes():
+        for result in results:
+            save_check(result)
     
     # Query latest status (similar to dashboard query)
     conn = sqlite3.connect(temp_db)
@@ -181,12 +333,7 @@ def test_get_latest_status(temp_db):
             status_code,
             ok,
             latency_ms
-        FROM checks
-        WHERE (name, timestamp_utc) IN (
-            SELECT name, MAX(timestamp_utc)
-            FROM checks
-            GROUP BY name
-        )
+        FROM latest_status
         ORDER BY name
     """
     cursor = conn.cursor()
@@ -198,11 +345,111 @@ def test_get_latest_status(temp_db):
     
     # Endpoint A should have the latest check (11:00)
     endpoint_a = [r for r in rows if r[0] == 'Endpoint A'][0]
-    assert endpoint_a[2] == '2024-01-01T11:00:00+00:00'
+    assert endpoint_a[2] == 1704106800000000
     assert endpoint_a[5] == 150.0
     
     # Endpoint B should have its only check
     endpoint_b = [r for r in rows if r[0] == 'Endpoint B'][0]
-    assert endpoint_b[2] == '2024-01-01T10:30:00+00:00'
+    assert endpoint_b[2] == 1704105000000000
     assert endpoint_b[3] == 404
 
+
+def test_batch_writes_rolls_back_on_error(temp_db):
+    """Test that a failing batch leaves no partial writes behind."""
+    result = {
+        'timestamp_utc': int(time.time() * 1_000_000),
+        'name': 'Endpoint A',
+        'url': 'https://example.com/a',
+        'status_code': 200,
+        'ok': True,
+        'latency_ms': 100.0,
+        'error_type': None,
+        'error_message': None
+    }
+    
+    with pytest.raises(RuntimeError):
+        with batch_writes():
+            save_check(result)
+            raise RuntimeError("boom")
+    
+    conn = sqlite3.connect(temp_db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM checks")
+    count = cursor.fetchone()[0]
+    conn.close()
+    
+    assert count == 0
+
+
+def test_init_database_backfills_latest_status(temp_db):
+    """Test that init_database fills latest_status from existing checks."""
+    save_check({
+        'timestamp_utc': int(time.time() * 1_000_000),
+        'name': 'Endpoint A',
+        'url': 'https://example.com/a',
+        'status_code': 200,
+        'ok': True,
+        'latency_ms': 100.0,
+        'error_type': None,
+        'error_message': None
+    })
+    
+    conn = sqlite3.connect(temp_db)
+    conn.execute("DELETE FROM latest_status")
+    conn.commit()
+    conn.close()
+    
+    init_database()
+    
+    conn = sqlite3.connect(temp_db)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name, latency_ms FROM latest_status")
+    rows = cursor.fetchall()
+    conn.close()
+    
+    assert rows == [('Endpoint A', 100.0)]
+
+
+def test_rollup_checks(temp_db):
+    """Test rolling up old checks into per-minute buckets."""
+    minute = 60_000_000
+    base = 1704103200000000  # 2024-01-01T10:00:00Z
+    
+    def make_result(offset_us, ok, latency_ms):
+        return {
+            'timestamp_utc': base + offset_us,
+            'name': 'Endpoint A',
+            'url': 'https://example.com/a',
+            'status_code': 200 if ok else 500,
+            'ok': ok,
+            'latency_ms': latency_ms,
+            'error_type': None,
+            'error_message': None
+        }
+    
+    save_checks([
+        make_result(0, True, 100.0),
+        make_result(30_000_000, False, 300.0),
+        make_result(minute, True, 50.0),
+        make_result(2 * minute, True, 75.0),
+    ])
+    
+    rollup_checks(base + 2 * minute)
+    
+    conn = sqlite3.connect(temp_db)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT bucket_ts, n, ok_n, avg_latency, max_latency
+        FROM checks_1m
+        ORDER BY bucket_ts
+    """)
+    buckets = cursor.fetchall()
+    cursor.execute("SELECT timestamp_utc FROM checks")
+    remaining = cursor.fetchall()
+    conn.close()
+    
+    assert buckets == [
+        (base, 2, 1, 200.0, 300.0),
+        (base + minute, 1, 1, 50.0, 50.0),
+    ]
+    assert remaining == [(base + 2 * minute,)]